@@ -0,0 +1,273 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import time
+from os.path import isfile, join
+
+import main
+from standin import MockService
+
+try:
+    import resource  # not available on Windows, resource usage is then left out of the results
+except ImportError:
+    resource = None
+
+# metric name to whether a higher value is better, used to tell regressions from improvements
+BENCHMARK_METRICS = {
+    "source_seconds_per_second": True,
+    "encode_source_seconds_per_second": True,
+    "links_per_second": True,
+    "wall_seconds": False,
+    "peak_rss_mb": False,
+    "peak_child_rss_mb": False,
+    "cpu_utilisation": None,  # reported, but neither direction is a regression
+    "check_links_seconds": False
+}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Imports synthetic titles through the batch pipeline against a local stand-in for the Dropbox and "
+                    "lethflix APIs, and reports encode and link throughput. Arguments after -- are passed to the "
+                    "importer, e.g. -- --ladder --workers 4 --link-concurrency 128")
+    parser.add_argument(
+        '--work-dir', type=str, default=join(os.path.expanduser("~"), ".lfimport", "benchmark"),
+        help='directory for the generated sources and the imported library')
+    parser.add_argument('--titles', type=int, default=1, help='number of titles to import')
+    parser.add_argument('--duration', type=float, default=60, help='length of the main source of a title in seconds')
+    parser.add_argument('--bonus', type=int, default=1, help='number of bonus sources per title')
+    parser.add_argument('--bonus-duration', type=float, default=15, help='length of a bonus source in seconds')
+    parser.add_argument('--resolution', type=str, default="1920x1080", help='resolution of the sources')
+    parser.add_argument('--frame-rate', type=int, default=30, help='frame rate of the sources')
+    parser.add_argument('--chapters', type=int, default=4, help='number of chapters of a main source')
+    parser.add_argument('--latency', type=float, default=0.05, help='latency of the stand-in APIs in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='random latency added on top, in seconds')
+    parser.add_argument(
+        '--rate-limit', type=float, default=0.0, help='share of share link requests answered with 429')
+    parser.add_argument(
+        '--error-rate', type=float, default=0.0, help='share of share link requests answered with 500')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the injected latency and failures')
+    parser.add_argument(
+        '--upload', action='store_true',
+        help='import into a local output directory and upload the content through the upload session API of the '
+             'stand-in, instead of letting it see the library directly')
+    parser.add_argument(
+        '--revoke', type=float, default=0.0,
+        help='after the import, revoke this share of the links and time the link health check that repairs them')
+    parser.add_argument('--baseline', type=str, default=None, help='baseline results to compare against')
+    parser.add_argument(
+        '--save-baseline', action='store_true', help='store the results as the new baseline instead of comparing')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.1, help='relative change beyond which a metric counts as a regression')
+    parser.add_argument('importer_args', nargs=argparse.REMAINDER, help='arguments passed on to the importer')
+    args = parser.parse_args()
+    if len(args.importer_args) > 0 and args.importer_args[0] == "--":
+        args.importer_args = args.importer_args[1:]
+    return args
+
+
+def write_srt(path, duration):
+    """ Writes a subtitle file with a cue every ten seconds """
+    with open(path, "w+") as srt:
+        for n in range(int(duration // 10)):
+            srt.write("%s\n%s --> %s\nsubtitle %s\n\n" % (n + 1, main.format_timestamp(n * 10).replace(".", ","),
+                                                         main.format_timestamp(n * 10 + 5).replace(".", ","), n + 1))
+
+
+def generate_source(path, duration, resolution, frame_rate, chapters):
+    """ Encodes a synthetic test pattern with a sine tone and the given number of evenly spaced chapters. Sources are
+    generated once per set of parameters and then reused, so runs stay comparable """
+    if isfile(path):
+        return
+    print("generating %s seconds of %s source at %s..." % (duration, resolution, path))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    metadata_path = path + ".ffmetadata"
+    with open(metadata_path, "w+") as metadata:
+        metadata.write(";FFMETADATA1\n")
+        for n in range(chapters):
+            metadata.write("[CHAPTER]\nTIMEBASE=1/1000\nSTART=%s\nEND=%s\ntitle=Chapter %s\n" % (
+                int(duration * 1000 * n / chapters), int(duration * 1000 * (n + 1) / chapters), n + 1))
+    subprocess.check_call([
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", "testsrc2=size=%s:rate=%s:duration=%s" % (resolution, frame_rate, duration),
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000:duration=%s" % duration,
+        "-i", metadata_path, "-map", "0:v", "-map", "1:a", "-map_metadata", "2", "-map_chapters", "2",
+        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "18", "-c:a", "aac", "-b:a", "192k",
+        path + ".tmp.mkv"])
+    os.replace(path + ".tmp.mkv", path)
+    os.remove(metadata_path)
+
+
+def generate_sources(args):
+    """ Creates a source directory per title with its main and bonus sources, an .srt and a media.json, and returns
+    the queue file listing them along with the total source duration """
+    sources_path = join(args.work_dir, "sources", "%s_%sfps_%ss_%sx%ss_%sch" % (
+        args.resolution, args.frame_rate, args.duration, args.bonus, args.bonus_duration, args.chapters))
+    main_path = join(sources_path, "main.mkv")
+    generate_source(main_path, args.duration, args.resolution, args.frame_rate, args.chapters)
+    bonus_paths = [join(sources_path, "bonus%s.mkv" % (n + 1)) for n in range(args.bonus)]
+    for bonus_path in bonus_paths:
+        generate_source(bonus_path, args.bonus_duration, args.resolution, args.frame_rate, 0)
+    # the largest file of a directory is its main source, so the titles link the shared sources instead of copying
+    titles = []
+    for n in range(args.titles):
+        title_path = join(args.work_dir, "titles", "Benchmark Title %s" % (n + 1))
+        shutil.rmtree(title_path, ignore_errors=True)
+        os.makedirs(title_path)
+        for source_path in [main_path] + bonus_paths:
+            main.link_or_copy(source_path, join(title_path, os.path.basename(source_path)))
+        write_srt(join(title_path, "main.en.srt"), args.duration)
+        with open(join(title_path, "media.json"), "w+") as media:
+            media.write(json.dumps({"title": "Benchmark Title %s" % (n + 1), "director": "lfimport",
+                                    "description": "synthetic benchmark source", "tags": ["benchmark"]}))
+        titles.append(title_path)
+    queue_path = join(args.work_dir, "queue.txt")
+    with open(queue_path, "w+") as queue:
+        queue.write("\n".join(titles) + "\n")
+    return queue_path, args.titles * (args.duration + args.bonus * args.bonus_duration)
+
+
+def get_resource_usage():
+    """ Returns the CPU seconds and peak resident set size in megabytes of this process and of its finished child
+    processes, None where the platform does not tell """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {"cpu": usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime,
+            "rss_mb": usage.ru_maxrss / 1024, "child_rss_mb": children.ru_maxrss / 1024}  # ru_maxrss is in kB
+
+
+def get_stage_span(stages, name):
+    """ Returns the wall time from the first start to the last end of a stage over all titles """
+    stages = [stage for stage in stages if stage["stage"] == name]
+    if len(stages) == 0:
+        return None
+    return max(stage["start"] + stage["duration"] for stage in stages) - min(stage["start"] for stage in stages)
+
+
+def run_benchmark(args):
+    """ Imports the synthetic titles through the batch pipeline against the stand-in services and measures it """
+    queue_path, source_seconds = generate_sources(args)
+    library_path = join(args.work_dir, "library")
+    upload_path = join(args.work_dir, "upload")  # with --upload, the content is written here and uploaded
+    for path in [library_path, upload_path]:
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(library_path)
+    for file in os.listdir(args.work_dir):
+        if file.startswith("queue.linkjournal.sqlite") or file == "queue.uploadstate.json":
+            os.remove(join(args.work_dir, file))  # every run resolves all of its links and uploads all of its files
+
+    service = MockService(library_path, args.latency, args.jitter, args.rate_limit, args.error_rate, args.seed)
+    service.start()
+    main.LF_URL = service.url
+    main.LF_ADMIN_TOKEN = "benchmark"  # the stand-in accepts any token, so no config.json is needed
+    main.DROPBOX_API_URL = service.url + "2/"
+    main.DROPBOX_NOTIFY_URL = service.url + "2/"
+    main.LF_LIBRARY_PATH = library_path
+
+    assert "--upload" not in args.importer_args, "use the --upload option of the benchmark instead"
+    source_path, skip_encoding, options = main.get_source_path(
+        ["--batch", queue_path, "--probe-cache", join(args.work_dir, "probecache"),
+         "--source-index", join(args.work_dir, "sourceindex.json"),
+         "--metrics-report", join(args.work_dir, "metrics.json")] + (["--upload", upload_path] if args.upload else [])
+        + args.importer_args)
+    main.configure(options)
+    if options.upload is not None:
+        os.makedirs(upload_path)
+        main.UPLOADER = main.DropboxUploader(join(args.work_dir, "queue.uploadstate.json"), options.upload_workers,
+                                             session=service.create_session())
+
+    usage_before = get_resource_usage()
+    start = time.time()
+    main.network_check()
+    link_engine = main.get_link_engine(options.link_concurrency,
+                                       main.ShareLinkJournal(join(args.work_dir, "queue.linkjournal.sqlite")))
+    titles = main.run_batch(queue_path, link_engine, options)
+    wall_seconds = time.time() - start
+    usage_after = get_resource_usage()
+    report = main.METRICS.get_report()
+    failed = [title["name"] for title in titles if title["error"] is not None]
+    assert len(failed) == 0, "the following benchmark titles failed to import: %s" % failed
+    check = None
+    if args.revoke > 0:
+        revoked = service.revoke_links(args.revoke, args.seed)
+        print("revoked %s share links" % len(revoked))
+        check_start = time.time()
+        check = main.check_library_links(main.get_library_path(options), link_engine)
+        check = {"seconds": time.time() - check_start, "revoked": len(revoked), "links": check["links"],
+                 "relinked": check["relinked"], "unresolved": len(check["unresolved"])}
+    service.shutdown()
+
+    encode_seconds = get_stage_span(report["stages"], "encode")
+    # links are timed where they are resolved, which is during the encode when streaming
+    links = report["links"]["count"]
+    link_seconds = report["links"]["seconds"]
+    results = {
+        "source_seconds_per_second": source_seconds / wall_seconds,
+        "encode_source_seconds_per_second": source_seconds / encode_seconds if encode_seconds else None,
+        "links_per_second": links / link_seconds if link_seconds else None,
+        "wall_seconds": wall_seconds,
+        "peak_rss_mb": None,
+        "peak_child_rss_mb": None,
+        "cpu_utilisation": None,
+        "check_links_seconds": check["seconds"] if check is not None else None
+    }
+    if usage_before is not None:
+        results["peak_rss_mb"] = usage_after["rss_mb"]
+        results["peak_child_rss_mb"] = usage_after["child_rss_mb"]
+        results["cpu_utilisation"] = (usage_after["cpu"] - usage_before["cpu"]) / wall_seconds / (os.cpu_count() or 1)
+    return {
+        "scenario": {key: getattr(args, key) for key in ["titles", "duration", "bonus", "bonus_duration", "resolution",
+                                                         "frame_rate", "chapters", "latency", "jitter", "rate_limit",
+                                                         "error_rate", "seed", "upload", "revoke",
+                                                         "importer_args"]},
+        "results": results,
+        "details": {"source_seconds": source_seconds, "links": links,
+                    "created_links": service.counts.get("sharing/create_shared_link_with_settings", 0),
+                    "encode_seconds": encode_seconds,
+                    "link_seconds": link_seconds, "check": check, "requests": service.counts,
+                    "cpu_count": os.cpu_count()}
+    }
+
+
+def compare_results(baseline, current, tolerance):
+    """ Prints the results next to the baseline and returns the names of the metrics that got worse by more than the
+    tolerance """
+    if baseline["scenario"] != current["scenario"]:
+        print("warning: the baseline was measured with a different scenario: %s" % baseline["scenario"])
+    regressions = []
+    print("%-34s %12s %12s %9s" % ("metric", "baseline", "current", "change"))
+    for name, higher_is_better in BENCHMARK_METRICS.items():
+        old, new = baseline["results"].get(name), current["results"][name]
+        if old is None or new is None or old == 0:
+            print("%-34s %12s %12s %9s" % (name, old, new, "n/a"))
+            continue
+        change = (new - old) / old
+        regressed = higher_is_better is not None and (change < -tolerance if higher_is_better else change > tolerance)
+        if regressed:
+            regressions.append(name)
+        print("%-34s %12.3f %12.3f %+8.1f%%%s" % (name, old, new, change * 100, "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    os.makedirs(arguments.work_dir, exist_ok=True)
+    baseline_path = arguments.baseline or join(arguments.work_dir, "baseline.json")
+    benchmark = run_benchmark(arguments)
+    with open(join(arguments.work_dir, "results.json"), "w+") as results_file:
+        results_file.write(json.dumps(benchmark, indent=4))
+    print("benchmark results: %s" % json.dumps(benchmark["results"], indent=4))
+    if arguments.save_baseline or not isfile(baseline_path):
+        with open(baseline_path, "w+") as baseline_file:
+            baseline_file.write(json.dumps(benchmark, indent=4))
+        print("stored the results as baseline in %s" % baseline_path)
+    else:
+        with open(baseline_path) as baseline_file:
+            regressed = compare_results(json.load(baseline_file), benchmark, arguments.tolerance)
+        if len(regressed) > 0:
+            print("the following metrics regressed by more than %.0f%%: %s" % (arguments.tolerance * 100, regressed))
+            exit(1)
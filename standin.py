@@ -0,0 +1,266 @@
+import hashlib
+import http.server
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from os.path import isdir, join
+
+import requests
+
+import main
+
+
+class StandInAdapter(requests.adapters.HTTPAdapter):
+    """ Sends every request to the stand-in service, keeping its path. Mounted for https://, it points the Dropbox SDK
+    at the stand-in, which only talks to its pinned hosts otherwise """
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url.rstrip("/")
+
+    def send(self, request, **kwargs):
+        request.url = self.url + urllib.parse.urlsplit(request.url).path
+        return super().send(request, **kwargs)
+
+
+class MockService(http.server.ThreadingHTTPServer):
+    """ Stands in for the Dropbox sharing, list_folder and upload session API and the lethflix verify and tunnel
+    endpoints, for the benchmark and the tests. Its Dropbox sees the local library directory, as if the desktop client
+    had synchronized it instantly, and files committed through upload sessions are written into it. Every request is
+    delayed by the configured latency, and share link requests fail with 429 or 500 at the configured rates. The
+    append_v2 call with the number fail_append is answered with an error, as if the upload was interrupted there """
+    daemon_threads = True
+
+    def __init__(self, library_path, latency=0.0, jitter=0.0, rate_limit=0.0, error_rate=0.0, seed=0,
+                 fail_append=None):
+        super().__init__(("127.0.0.1", 0), MockRequestHandler)
+        self.library_path = library_path
+        self.fail_append = fail_append
+        self.sessions = {}  # upload session id to the received bytes and whether the session is closed
+        self.jobs = {}  # async job id to the finish batch result
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.content_hashes = {}  # (path, size, mtime) to content hash
+        self.links = {}  # lower case path to its current share url
+        self.revocations = {}  # lower case path to the number of times its link was revoked
+        self.url = "http://127.0.0.1:%s/" % self.server_address[1]
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            return self.counts[key]
+
+    def get_fault(self):
+        """ Decides the latency of a request and whether it fails, from the seeded random generator """
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            roll = self.random.random()
+        if roll < self.rate_limit:
+            return delay, 429
+        if roll < self.rate_limit + self.error_rate:
+            return delay, 500
+        return delay, None
+
+    def get_content_hash(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        if key not in self.content_hashes:
+            self.content_hashes[key] = main.get_dropbox_content_hash(path)
+        return self.content_hashes[key]
+
+    def get_local_path(self, dropbox_path):
+        return join(self.library_path, *[part for part in dropbox_path.split("/")[2:] if part != ""])
+
+    def list_folder(self, dropbox_path):
+        """ Lists the library below a /library1 path, None if it does not exist """
+        local_path = self.get_local_path(dropbox_path)
+        if not isdir(local_path):
+            return None
+        entries = []
+        for root, dirs, files in os.walk(local_path):
+            for file in files:
+                file_path = join(root, file)
+                path_lower = (dropbox_path.rstrip("/") + "/" + os.path.relpath(file_path, local_path).replace(
+                    os.sep, "/")).lower()
+                entries.append({".tag": "file", "path_lower": path_lower, "size": os.path.getsize(file_path),
+                                "content_hash": self.get_content_hash(file_path)})
+        return entries
+
+    def create_link(self, path):
+        """ Returns the share url of a path, creating it if there is none. A revoked link is replaced by a new url """
+        with self.lock:
+            path_lower = path.lower()
+            if path_lower not in self.links:
+                url_id = hashlib.sha1(("%s:%s" % (path_lower, self.revocations.get(path_lower, 0))).encode())
+                self.links[path_lower] = "https://www.dropbox.com/s/%s/%s?dl=0" % (
+                    url_id.hexdigest()[:15], urllib.parse.quote(path.split("/")[-1]))
+            return self.links[path_lower]
+
+    def revoke_links(self, share, seed):
+        """ Revokes the given share of all links, picked with a seeded generator """
+        with self.lock:
+            paths = sorted(self.links.keys())
+            revoked = random.Random(seed).sample(paths, int(len(paths) * share))
+            for path_lower in revoked:
+                del self.links[path_lower]
+                self.revocations[path_lower] = self.revocations.get(path_lower, 0) + 1
+        return revoked
+
+    def commit_upload(self, session_id, offset, dropbox_path):
+        """ Writes the contents of a closed upload session into the library, returns the metadata of the file """
+        with self.lock:
+            session = self.sessions[session_id]
+        assert session["closed"] and offset == len(session["data"]), "commit of an incomplete upload session"
+        local_path = self.get_local_path(dropbox_path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path + ".tmp", "wb") as file:
+            file.write(session["data"])
+        os.replace(local_path + ".tmp", local_path)
+        return {".tag": "success", "name": dropbox_path.split("/")[-1], "id": "id:%s" % session_id,
+                "path_lower": dropbox_path.lower(), "path_display": dropbox_path,
+                "client_modified": "2026-01-01T00:00:00Z", "server_modified": "2026-01-01T00:00:00Z",
+                "rev": "0123456789abcdef", "size": len(session["data"]),
+                "content_hash": self.get_content_hash(local_path)}
+
+    def create_session(self):
+        """ Creates a requests session that sends the calls of the Dropbox SDK to the stand-in """
+        session = requests.Session()
+        session.mount("https://", StandInAdapter(self.url))
+        return session
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class MockRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keeps the pooled connections of the importer alive
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body=None, headers=None):
+        data = (body.encode() if body == "null" else json.dumps(body).encode()) if body is not None else b""
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_HEAD(self):
+        self.server.count("lethflix/")
+        self.respond(200)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        self.server.count("lethflix" + url.path)
+        time.sleep(self.server.get_fault()[0])
+        if url.path == "/tunnel":
+            self.respond(302, headers={"Location": urllib.parse.parse_qs(url.query)["url"][0]})
+        else:
+            self.respond(404, {"error": "not found"})
+
+    def respond_error(self, error):
+        self.respond(409, {"error_summary": "%s/" % error[".tag"], "error": error})
+
+    def do_upload(self, endpoint, content):
+        """ Serves the upload session endpoints, whose argument is passed in the Dropbox-API-Arg header """
+        argument = json.loads(self.headers["Dropbox-API-Arg"])
+        count = self.server.count(endpoint)
+        service = self.server
+        if endpoint == "files/upload_session/start":
+            with service.lock:
+                session_id = "session%s" % len(service.sessions)
+                service.sessions[session_id] = {"data": content, "closed": argument.get("close", False)}
+            self.respond(200, {"session_id": session_id})
+            return
+        if count == service.fail_append:
+            self.respond_error({".tag": "too_large"})
+            return
+        with service.lock:
+            session = service.sessions.get(argument["cursor"]["session_id"])
+            if session is None:
+                error = {".tag": "not_found"}
+            elif argument["cursor"]["offset"] != len(session["data"]):
+                error = {".tag": "incorrect_offset", "correct_offset": len(session["data"])}
+            else:
+                error = None
+                session["data"] += content
+                session["closed"] = argument.get("close", False)
+        if error is not None:
+            self.respond_error(error)
+        else:
+            self.respond(200, "null")  # the JSON null of a call without result, as Dropbox answers
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        content = self.rfile.read(length)
+        if url.path in ["/2/files/upload_session/start", "/2/files/upload_session/append_v2"]:
+            time.sleep(self.server.get_fault()[0])
+            self.do_upload(url.path[3:], content)
+            return
+        data = json.loads(content or b"{}") if url.path.startswith("/2/") else {}
+        if not url.path.startswith("/2/"):
+            self.server.count("lethflix" + url.path)
+            time.sleep(self.server.get_fault()[0])
+            self.respond(200 if url.path == "/verify" else 404, {})
+            return
+        endpoint = url.path[3:]
+        delay, failure = self.server.get_fault()
+        time.sleep(delay)
+        if endpoint.startswith("sharing/") and failure is not None:
+            self.server.count("%s/%s" % (endpoint, failure))
+            self.respond(failure, {"error_summary": "injected"}, {"Retry-After": "0"} if failure == 429 else None)
+            return
+        self.server.count(endpoint)
+        if endpoint == "sharing/create_shared_link_with_settings":
+            self.respond(200, {"url": self.server.create_link(data["path"]), "path_lower": data["path"].lower()})
+        elif endpoint == "sharing/list_shared_links":
+            # pages of 200 links, like the real endpoint
+            with self.server.lock:
+                links = sorted(self.server.links.items())
+            start = int(data.get("cursor", 0))
+            self.respond(200, {"links": [{"url": url, "path_lower": path} for path, url in links[start:start + 200]],
+                               "has_more": start + 200 < len(links), "cursor": str(start + 200)})
+        elif endpoint == "sharing/get_shared_link_metadata":
+            with self.server.lock:
+                known = data["url"] in self.server.links.values()
+            if known:
+                self.respond(200, {"url": data["url"]})
+            else:
+                self.respond(409, {"error_summary": "shared_link_not_found/"})
+        elif endpoint in ["files/list_folder", "files/list_folder/continue"]:
+            dropbox_path = data.get("path", data.get("cursor"))  # the cursor is the listed path
+            entries = self.server.list_folder(dropbox_path)
+            if entries is None:
+                self.respond(409, {"error_summary": "path/not_found/"})
+            else:
+                self.respond(200, {"entries": entries, "cursor": dropbox_path, "has_more": False})
+        elif endpoint == "files/list_folder/longpoll":
+            self.respond(200, {"changes": True})
+        elif endpoint == "files/upload_session/finish_batch":
+            # committed right away, the async job is complete on its first check
+            entries = [self.server.commit_upload(entry["cursor"]["session_id"], entry["cursor"]["offset"],
+                                                 entry["commit"]["path"]) for entry in data["entries"]]
+            with self.server.lock:
+                job_id = "job%s" % len(self.server.jobs)
+                self.server.jobs[job_id] = entries
+            self.respond(200, {".tag": "async_job_id", "async_job_id": job_id})
+        elif endpoint == "files/upload_session/finish_batch/check":
+            with self.server.lock:
+                entries = self.server.jobs[data["async_job_id"]]
+            self.respond(200, {".tag": "complete", "entries": entries})
+        else:
+            self.respond(400, {"error_summary": "unsupported endpoint %s" % endpoint})
+
+
@@ -0,0 +1,28 @@
+import main
+
+
+def write_manifest(path, lines):
+    path.mkdir()
+    (path / "manifest.m3u8").write_text("\n".join(["#EXTM3U", "#EXT-X-VERSION:4", "#EXT-X-TARGETDURATION:4"] + lines
+                                                  + ["#EXT-X-ENDLIST"]) + "\n")
+
+
+def test_bandwidth_of_byte_ranges(tmp_path):
+    rendition_path = tmp_path / "480x270@365k"
+    write_manifest(rendition_path, ["#EXTINF:4.000000,", "#EXT-X-BYTERANGE:500000@0", "480x270@365k.ts",
+                                    "#EXTINF:2.000000,", "#EXT-X-BYTERANGE:900000@500000", "480x270@365k.ts"])
+    peak, average = main.compute_rendition_bandwidth(str(rendition_path), ["480x270@365k.ts"])
+    assert peak == 900000 * 8 // 2
+    assert average == 1866667  # 11.2 Mbit over 6 seconds, rounded up
+
+
+def test_bandwidth_of_segment_files(tmp_path):
+    rendition_path = tmp_path / "480x270@365k"
+    write_manifest(rendition_path, ["#EXTINF:4.000000,", "480x270@365k_000.ts",
+                                    "#EXTINF:4.000000,", "480x270@365k_001.ts"])
+    (rendition_path / "480x270@365k_000.ts").write_bytes(b"\0" * 100000)
+    (rendition_path / "480x270@365k_001.ts").write_bytes(b"\0" * 300000)
+    peak, average = main.compute_rendition_bandwidth(str(rendition_path),
+                                                     ["480x270@365k_000.ts", "480x270@365k_001.ts"])
+    assert peak == 300000 * 8 // 4
+    assert average == 400000 * 8 // 8
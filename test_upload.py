@@ -0,0 +1,74 @@
+import json
+import os
+from os.path import join
+
+import pytest
+
+import main
+from standin import MockService
+
+
+def create_uploader(service, state_path, max_workers):
+    return main.DropboxUploader(state_path, max_workers=max_workers, chunk_size=1024, max_in_flight_bytes=2048,
+                                session=service.create_session())
+
+
+def read_file(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+@pytest.fixture
+def files(tmp_path):
+    sizes = {"a.bin": 3000, "b.bin": 2048, "c.bin": 10}
+    folder = tmp_path / "content"
+    folder.mkdir()
+    for name, size in sizes.items():
+        (folder / name).write_bytes(os.urandom(size))
+    return str(folder)
+
+
+def test_upload_in_chunks(tmp_path, files):
+    service = MockService(str(tmp_path / "library"))
+    service.start()
+    uploader = create_uploader(service, str(tmp_path / "uploadstate.json"), 2)
+    uploader.upload_folder(files, "/library1/Title")
+    service.shutdown()
+
+    for name in os.listdir(files):
+        assert read_file(join(tmp_path, "library", "Title", name)) == read_file(join(files, name))
+    assert service.counts["files/upload_session/start"] == 3
+    assert service.counts["files/upload_session/append_v2"] == 3  # 2 for a.bin, 1 for b.bin, none for c.bin
+    assert service.counts["files/upload_session/finish_batch"] == 1
+    with open(str(tmp_path / "uploadstate.json")) as state_file:
+        state = json.load(state_file)
+    assert state["sessions"] == {} and len(state["uploaded"]) == 3
+
+
+def test_resume_from_upload_state(tmp_path, files):
+    service = MockService(str(tmp_path / "library"), fail_append=2)
+    service.start()
+    state_path = str(tmp_path / "uploadstate.json")
+    interrupted = create_uploader(service, state_path, 1)
+    with pytest.raises(main.dropbox.exceptions.ApiError):
+        interrupted.upload_folder(files, "/library1/Title")
+    interrupted.executor.shutdown()
+    with open(state_path) as state_file:
+        state = json.load(state_file)
+    # a.bin is the only file with two appends, so the failing one is always its own
+    interrupted_session = state["sessions"][join(files, "a.bin")]
+    assert interrupted_session["offset"] > 0 and not interrupted_session["closed"] and state["uploaded"] == {}
+    assert "files/upload_session/finish_batch" not in service.counts
+
+    resumed = create_uploader(service, state_path, 2)
+    resumed.upload_folder(files, "/library1/Title")
+    for name in os.listdir(files):
+        assert read_file(join(tmp_path, "library", "Title", name)) == read_file(join(files, name))
+    # the sessions of the interrupted run were continued, not started again
+    assert service.counts["files/upload_session/start"] == 3
+
+    # everything is uploaded in its current version, so a rerun has nothing left to do
+    counts = dict(service.counts)
+    create_uploader(service, state_path, 2).upload_folder(files, "/library1/Title")
+    assert service.counts == counts
+    service.shutdown()